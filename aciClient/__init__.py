@@ -1,7 +1,15 @@
 from aciClient.aci import ACI
 from aciClient.aciCertClient import ACICert
+from aciClient.aciEventPipeline import EventPipeline
+from aciClient.aciFanout import ACIFanout
+from aciClient.aciRefreshScheduler import RefreshScheduler
+from aciClient.aciStatsCollector import StatsCollector
 
 __all__ = [
     'ACI',
-    'ACICert'
+    'ACICert',
+    'ACIFanout',
+    'EventPipeline',
+    'RefreshScheduler',
+    'StatsCollector'
 ]
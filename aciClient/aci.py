@@ -7,10 +7,15 @@
 
 AciClient for doing Username/Password based RestCalls to the APIC
 """
+import hashlib
 import logging
 import json
+import os
 import requests
 import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import urllib3
 from requests.adapters import HTTPAdapter
@@ -24,6 +29,9 @@ except ImportError:
 
 requests.packages.urllib3.disable_warnings()
 
+# operSt of a configJob that has not finished yet
+SNAPSHOT_JOB_RUNNING = ('pending', 'running')
+
 
 class ACI:
     __logger = logging.getLogger(__name__)
@@ -31,7 +39,7 @@ class ACI:
     # ==============================================================================
     # constructor
     # ==============================================================================
-    def __init__(self, apicIp, apicUser, apicPasword, refresh=False, proxies=None):
+    def __init__(self, apicIp, apicUser, apicPasword, refresh=False, proxies=None, scheduler=None):
         self.__logger.debug('Constructor called')
         self.apicIp = apicIp
         self.apicUser = apicUser
@@ -45,15 +53,21 @@ class ACI:
         self.refresh_next = None
         self.refresh_thread = None
         self.refresh_offset = 30
+        self.refresh_scheduler = scheduler
         self.session = None
         self.token = None
         # See https://urllib3.readthedocs.io/en/stable/reference/urllib3.util.html
         self.total_retry_attempts = 5
         self.retry_backoff_factor = 10  # in seconds; multiplied by previous attempts.
+        self.request_timeout = None  # in seconds; None waits forever (login waits 5s)
+        self.snapshot_path = 'files/snapshots/'  # where the APIC serves the snapshot files, relative to the host
 
     def __refresh_session_timer(self, response):
         self.__logger.debug(f'refreshing the token {self.refresh_offset}s before it expires')
         self.refresh_next = int(response.json()['imdata'][0]['aaaLogin']['attributes']['refreshTimeoutSeconds'])
+        if self.refresh_scheduler is not None:
+            self.refresh_scheduler.register(self, self.refresh_next - self.refresh_offset)
+            return
         self.refresh_thread = threading.Timer(self.refresh_next - self.refresh_offset, self.renewCookie)
         self.__logger.debug(f'starting thread to refresh token in {self.refresh_next - self.refresh_offset}s')
         self.refresh_thread.start()
@@ -61,7 +75,7 @@ class ACI:
     # ==============================================================================
     # login
     # ==============================================================================
-    def login(self) -> bool:
+    def login(self, timeout=None) -> bool:
         self.__logger.debug('login called')
 
         retry_strategy = urllib3.Retry(
@@ -83,7 +97,9 @@ class ACI:
         userPass = json.dumps({'aaaUser': {'attributes': {'name': self.apicUser, 'pwd': self.apicPassword}}})
 
         self.__logger.info(f'Login to apic {self.baseUrl}')
-        response = self.session.post(self.baseUrl + 'aaaLogin.json', data=userPass, verify=False, timeout=5)
+        if timeout is None:
+            timeout = self.request_timeout if self.request_timeout is not None else 5
+        response = self.session.post(self.baseUrl + 'aaaLogin.json', data=userPass, verify=False, timeout=timeout)
 
         # Don't raise an exception for 401
         if response.status_code == 401:
@@ -111,15 +127,19 @@ class ACI:
             if self.refresh_thread.is_alive():
                 self.__logger.debug('Stoping refresh_auto thread')
                 self.refresh_thread.cancel()
+        if self.refresh_scheduler is not None:
+            self.refresh_scheduler.unregister(self)
         self.postJson(jsonData={'aaaUser': {'attributes': {'name': self.apicUser}}}, url='aaaLogout.json')
         self.__logger.debug('Logout from APIC sucessfull')
 
     # ==============================================================================
     # renew cookie (aaaRefresh)
     # ==============================================================================
-    def renewCookie(self) -> bool:
+    def renewCookie(self, timeout=None) -> bool:
         self.__logger.debug('Renew Cookie called')
-        response = self.session.post(self.baseUrl + 'aaaRefresh.json', verify=False)
+        if timeout is None:
+            timeout = self.request_timeout
+        response = self.session.post(self.baseUrl + 'aaaRefresh.json', verify=False, timeout=timeout)
 
         if response.status_code == 200:
             if self.refresh_auto:
@@ -128,7 +148,9 @@ class ACI:
             self.__logger.debug('Successfuly renewed the token')
         else:
             self.token = False
-            self.refresh_auto = False
+            # with a scheduler the session stays registered, the scheduler falls back to a new login
+            if self.refresh_scheduler is None:
+                self.refresh_auto = False
             self.__logger.error(f'Could not renew token. {response.text}')
             response.raise_for_status()
             return False
@@ -150,7 +172,7 @@ class ACI:
 
         if subscription:
             url = '{}?subscription=yes'.format(url)
-        response = self.session.get(url, verify=False)
+        response = self.session.get(url, verify=False, timeout=self.request_timeout)
 
         if response.ok:
             responseJson = response.json()
@@ -190,7 +212,7 @@ class ACI:
             page += 1
             url_to_call = urlunparse((parsed_url[0], parsed_url[1], parsed_url[2], parsed_url[3],
                                       urlencode(parsed_query), parsed_url[5]))
-            response = self.session.get(url_to_call, verify=False)
+            response = self.session.get(url_to_call, verify=False, timeout=self.request_timeout)
 
             if response.ok:
                 responseJson = response.json()
@@ -214,7 +236,8 @@ class ACI:
     # ==============================================================================
     def postJson(self, jsonData, url='mo.json') -> {}:
         self.__logger.debug(f'Post Json called data: {jsonData}')
-        response = self.session.post(self.baseUrl + url, verify=False, data=json.dumps(jsonData, sort_keys=True))
+        response = self.session.post(self.baseUrl + url, verify=False, data=json.dumps(jsonData, sort_keys=True),
+                                     timeout=self.request_timeout)
         if response.status_code == 200:
             self.__logger.debug(f'Successful Posted Data to APIC: {response.json()}')
             return response.status_code
@@ -232,7 +255,7 @@ class ACI:
     # ==============================================================================
     def deleteMo(self, dn) -> int:
         self.__logger.debug(f'Delete Mo called DN: {dn}')
-        response = self.session.delete(self.baseUrl + "mo/" + dn + ".json", verify=False)
+        response = self.session.delete(self.baseUrl + "mo/" + dn + ".json", verify=False, timeout=self.request_timeout)
 
         # Raise Exception if http Error occurred
         response.raise_for_status()
@@ -242,7 +265,7 @@ class ACI:
     # ==============================================================================
     # snapshot
     # ==============================================================================
-    def snapshot(self, description="snapshot", target_dn="") -> bool:
+    def snapshot(self, description="snapshot", target_dn="", name="aciclient") -> bool:
         self.__logger.debug(f'snapshot called {description}')
 
         json_payload = [
@@ -251,11 +274,11 @@ class ACI:
                     "attributes": {
                         "adminSt": "triggered",
                         "descr": f"by aciClient - {description}",
-                        "dn": "uni/fabric/configexp-aciclient",
+                        "dn": f"uni/fabric/configexp-{name}",
                         "format": "json",
                         "includeSecureFields": "yes",
                         "maxSnapshotCount": "global-limit",
-                        "name": "aciclient",
+                        "name": f"{name}",
                         "nameAlias": "",
                         "snapshot": "yes",
                         "targetDn": f"{target_dn}"
@@ -272,6 +295,137 @@ class ACI:
             self.__logger.error(f'snapshot creation not succesfull: {response}')
             return False
 
+    # ==============================================================================
+    # getSnapshotJobs
+    # ==============================================================================
+    def getSnapshotJobs(self, name="aciclient") -> []:
+        uri = (f'mo/uni/backupst/jobs-[uni/fabric/configexp-{name}].json'
+               f'?query-target=children&target-subtree-class=configJob')
+        response = self.getJson(uri)
+        if not isinstance(response, list):
+            self.__logger.error(f'Could not get snapshot jobs of {name}: {response}')
+            return []
+        return [mo['configJob']['attributes'] for mo in response if 'configJob' in mo]
+
+    # ==============================================================================
+    # waitSnapshotJob
+    # ==============================================================================
+    def waitSnapshotJob(self, name="aciclient", known_jobs=(), timeout=600, poll_min=1, poll_max=30) -> {}:
+        """wait for the first job of name that isn't in known_jobs to finish, returns its attributes or None"""
+        self.__logger.debug(f'waitSnapshotJob called {name}')
+        deadline = time.monotonic() + timeout
+        interval = poll_min
+        state = None
+
+        while True:
+            jobs = [job for job in self.getSnapshotJobs(name) if job['dn'] not in known_jobs]
+            if jobs:
+                job = max(jobs, key=lambda job: job.get('executeTime', ''))
+                if job.get('operSt') not in SNAPSHOT_JOB_RUNNING:
+                    self.__logger.debug(f'snapshot job {job["dn"]} finished: {job.get("operSt")}')
+                    return job
+                if job.get('operSt') != state:
+                    # poll fast again after every state change
+                    state = job.get('operSt')
+                    interval = poll_min
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.__logger.error(f'snapshot job of {name} did not finish within {timeout}s')
+                return None
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 1.5, poll_max)
+
+    # ==============================================================================
+    # downloadSnapshot
+    # ==============================================================================
+    def downloadSnapshot(self, file_name, path, chunk_size=1024 * 1024) -> str:
+        """stream the snapshot file to path (a file or a directory) without loading it into memory"""
+        # the file name comes from the APIC, it must not point outside of path
+        file_name = os.path.basename(file_name)
+        if os.path.isdir(path):
+            path = os.path.join(path, file_name)
+        url = 'https://' + self.apicIp + '/' + self.snapshot_path + file_name
+        self.__logger.debug(f'Download snapshot {url} to {path}')
+
+        try:
+            with self.session.get(url, verify=False, stream=True, timeout=self.request_timeout) as response:
+                # Raise Exception if http Error occurred
+                response.raise_for_status()
+                # a partly written file never ends up at path
+                with open(path + '.part', 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+            os.replace(path + '.part', path)
+        except Exception:
+            if os.path.exists(path + '.part'):
+                os.remove(path + '.part')
+            raise
+        self.__logger.debug(f'Successful downloaded snapshot to {path}')
+        return path
+
+    # ==============================================================================
+    # snapshotJob
+    # ==============================================================================
+    def snapshotJob(self, description="snapshot", target_dn="", name="aciclient", timeout=600,
+                    download_dir=None, cleanup=False) -> {}:
+        """trigger a snapshot and wait for its job, returns the job attributes or None
+
+        with cleanup the export policy is deleted once the job has finished, the snapshot itself is kept
+        """
+        self.__logger.debug(f'snapshotJob called {description} {target_dn}')
+        known_jobs = {job['dn'] for job in self.getSnapshotJobs(name)}
+        if not self.snapshot(description=description, target_dn=target_dn, name=name):
+            return None
+
+        job = self.waitSnapshotJob(name=name, known_jobs=known_jobs, timeout=timeout)
+        try:
+            if job is not None and job.get('operSt') == 'success' and download_dir is not None:
+                job['path'] = self.downloadSnapshot(job['fileName'], download_dir)
+        finally:
+            if cleanup and job is not None:
+                self.__deleteSnapshotPolicy(name)
+            elif cleanup:
+                # deleting the policy of a running job would abort it
+                self.__logger.warning(f'snapshot job of {name} still running, keeping uni/fabric/configexp-{name}')
+        return job
+
+    def __deleteSnapshotPolicy(self, name):
+        try:
+            self.deleteMo(f'uni/fabric/configexp-{name}')
+            self.__logger.debug(f'Deleted export policy {name}')
+        except Exception as e:
+            self.__logger.error(f'Could not delete export policy {name}: {e}')
+
+    # ==============================================================================
+    # snapshots
+    # ==============================================================================
+    def snapshots(self, target_dns, description="snapshot", max_workers=4, timeout=600, download_dir=None,
+                  cleanup=True) -> {}:
+        """snapshot several target DNs at the same time, returns {target_dn: job attributes or None}
+
+        every run uses its own export policies, with cleanup they are deleted when their job has finished
+        """
+        self.__logger.debug(f'snapshots called for {len(target_dns)} targets')
+        # a triggered policy only runs one job at a time, so every target and run needs its own one
+        run_id = uuid.uuid4().hex[:8]
+        names = {target_dn: f'aciclient-{hashlib.sha1(target_dn.encode()).hexdigest()[:8]}-{run_id}'
+                 for target_dn in target_dns}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {target_dn: executor.submit(self.snapshotJob, description=description, target_dn=target_dn,
+                                                  name=name, timeout=timeout, download_dir=download_dir,
+                                                  cleanup=cleanup)
+                       for target_dn, name in names.items()}
+
+        jobs = {}
+        for target_dn, future in futures.items():
+            try:
+                jobs[target_dn] = future.result()
+            except Exception as e:
+                self.__logger.error(f'snapshot of {target_dn} failed: {e}')
+                jobs[target_dn] = None
+        return jobs
+
 # ==============================================================================
     # subscribe
     # ==============================================================================
@@ -284,7 +438,7 @@ class ACI:
         endpoint = f"{self.baseUrl}{str(subscription_dn)}?{'&'.join(query_parameters)}"
         self.__logger.debug(f"Subscribe to: {endpoint}")
 
-        response = self.session.get(endpoint, verify=False)
+        response = self.session.get(endpoint, verify=False, timeout=self.request_timeout)
         if response.status_code == 200:
             self.__logger.debug(f"Successful subscribed to APIC: {response.json()}")
             return response.json()
@@ -310,7 +464,7 @@ class ACI:
         )
         self.__logger.debug(f"Refresh subscription: {subscription_id}")
 
-        response = self.session.post(endpoint, verify=False)
+        response = self.session.post(endpoint, verify=False, timeout=self.request_timeout)
         if response.status_code == 200:
             self.__logger.debug(f"Successful subscribed to APIC: {response.json()}")
             return response.json()
@@ -12,6 +12,8 @@ openssl req -new -newkey rsa:2048 -days 36500 -nodes -x509 -keyout apicUser.key
 """
 import logging
 from OpenSSL import crypto
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
 import base64
 import requests
 import json
@@ -29,13 +31,16 @@ class ACICert:
         self.baseUrl = 'https://' + self.apicIp + '/api/'
         self.__logger.debug(f'BaseUrl set to: {self.baseUrl}')
         self.pkey = crypto.load_privatekey(crypto.FILETYPE_PEM, open(pkPath, 'rb').read())
+        # crypto.sign was removed in pyOpenSSL 24.3, sign with the cryptography key instead
+        self.__signKey = self.pkey.to_cryptography_key()
         self.certDn = certDn
 
     # ==============================================================================
     # packCookies
     # ==============================================================================
     def packCookies(self, content) -> {}:
-        sigResult = base64.b64encode(crypto.sign(self.pkey, content, 'sha256')).decode()
+        signature = self.__signKey.sign(content.encode(), padding.PKCS1v15(), hashes.SHA256())
+        sigResult = base64.b64encode(signature).decode()
         # print('sigResultType', type(sigResult), sigResult)
         return {'APIC-Certificate-Fingerprint': 'fingerprint',
                 'APIC-Certificate-Algorithm': 'v1.0',
@@ -0,0 +1,534 @@
+# -*- coding: utf-8 -*-
+#
+# MIT License
+# Copyright (c) 2020 Netcloud AG
+
+"""APICEmulator
+
+Local HTTPS stand-in for an APIC, for tests and benchmarks of the client. It
+knows enough of the REST API for aciClient: aaaLogin/aaaRefresh/aaaLogout,
+class and MO queries with page/page-size, the "dataset too big" error, posts
+and deletes, subscriptions with websocket push, 429 throttling and a
+configurable latency. A triggered configExportP runs a configJob whose
+snapshot file can be downloaded from /files/snapshots/.
+
+Usage:
+    emulator = APICEmulator(latency=0.01).start()
+    emulator.addMos('fvTenant', [{'dn': f'uni/tn-t{i}', 'name': f't{i}'} for i in range(1000)])
+    aci = ACI(emulator.address, 'admin', 'password')
+"""
+import logging
+import base64
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import secrets
+import socket
+import socketserver
+import ssl
+import struct
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from OpenSSL import crypto
+
+try:
+    from urllib.parse import urlparse, parse_qsl, unquote
+except ImportError:
+    from urlparse import urlparse, parse_qsl
+    from urllib import unquote
+
+TOO_BIG = 'Unable to process the query, result dataset is too big'
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'APICEmulator'
+    # headers and body go out in one segment, otherwise Nagle adds ~40ms to small responses
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    __logger = logging.getLogger(__name__)
+
+    def log_message(self, format, *args):
+        self.__logger.debug(format % args)
+
+    def do_GET(self):
+        self.server.emulator.handle(self, 'GET')
+
+    def do_POST(self):
+        self.server.emulator.handle(self, 'POST')
+
+    def do_DELETE(self):
+        self.server.emulator.handle(self, 'DELETE')
+
+
+class APICEmulator:
+    __logger = logging.getLogger(__name__)
+
+    # ==============================================================================
+    # constructor
+    # ==============================================================================
+    def __init__(self, host='127.0.0.1', port=0, user='admin', password='password', latency=0.0,
+                 rate_limit=None, retry_after=1, max_result=50000, refresh_timeout=600, certfile=None,
+                 keyfile=None, snapshot_duration=1.0, snapshot_size=1024 * 1024):
+        self.__logger.debug(f'Constructor called {host}:{port}')
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.latency = latency  # in seconds; added to every request
+        self.rate_limit = rate_limit  # requests per second before answering 429, None for no limit
+        self.retry_after = retry_after  # in seconds; Retry-After header of a 429
+        self.max_result = max_result  # objects a query without page-size may return
+        self.refresh_timeout = refresh_timeout
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.snapshot_duration = snapshot_duration  # in seconds; until a triggered configJob succeeds
+        self.snapshot_size = snapshot_size  # in bytes; size of the snapshot files
+
+        self.requests = 0
+        self.throttled = 0
+        self.__classes = {}
+        self.__dns = {}
+        self.__tokens = {}
+        self.__subscriptions = {}
+        self.__sockets = {}
+        self.__files = {}
+        self.__subscription_ids = itertools.count(72057594037927937)
+        self.__lock = threading.RLock()
+        self.__bucket = None
+        self.__server = None
+        self.__thread = None
+        self.__tempdir = None
+
+    # ==============================================================================
+    # start / stop
+    # ==============================================================================
+    def start(self):
+        if self.certfile is None:
+            self.__tempdir = tempfile.TemporaryDirectory()
+            self.certfile, self.keyfile = self.__selfSignedCert(self.__tempdir.name)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.certfile, self.keyfile)
+
+        self.__server = _Server((self.host, self.port), _Handler)
+        # the TLS handshake happens in the request thread, not in the accept loop
+        self.__server.socket = context.wrap_socket(self.__server.socket, server_side=True,
+                                                   do_handshake_on_connect=False)
+        self.__server.emulator = self
+        self.port = self.__server.server_address[1]
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name='aciClient-emulator',
+                                         daemon=True)
+        self.__thread.start()
+        self.__logger.info(f'APIC emulator listening on https://{self.address}')
+        return self
+
+    def stop(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+        with self.__lock:
+            for ws in [ws for sockets in self.__sockets.values() for ws in sockets]:
+                try:
+                    ws.close()
+                except OSError:
+                    pass
+            self.__sockets.clear()
+        if self.__tempdir is not None:
+            self.__tempdir.cleanup()
+            self.__tempdir = None
+            self.certfile = self.keyfile = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def address(self) -> str:
+        """host:port, to be used as apicIp of the client"""
+        return f'{self.host}:{self.port}'
+
+    # ==============================================================================
+    # managed objects
+    # ==============================================================================
+    def addMos(self, cls, attributes_list) -> None:
+        """store objects of cls without pushing events, e.g. to load a benchmark dataset"""
+        with self.__lock:
+            objects = self.__classes.setdefault(cls, {})
+            for attributes in attributes_list:
+                objects[attributes['dn']] = {cls: {'attributes': dict(attributes)}}
+                self.__dns[attributes['dn']] = cls
+
+    def getMo(self, dn) -> {}:
+        with self.__lock:
+            cls = self.__dns.get(dn)
+            return self.__classes[cls][dn] if cls else None
+
+    def count(self, cls) -> int:
+        with self.__lock:
+            return len(self.__classes.get(cls, {}))
+
+    def push(self, mo, status='modified') -> None:
+        """send mo to the websockets subscribed to its class or dn"""
+        cls, body = next(iter(mo.items()))
+        attributes = dict(body.get('attributes', {}), status=status)
+        event = {cls: {'attributes': attributes}}
+        targets = {}
+        with self.__lock:
+            for subscription_id, (token, kind, name) in self.__subscriptions.items():
+                if (kind == 'class' and name == cls) or (kind == 'mo' and name == attributes.get('dn')):
+                    targets.setdefault(token, []).append(str(subscription_id))
+            sockets = [(ws, ids) for token, ids in targets.items() for ws in self.__sockets.get(token, [])]
+        for ws, ids in sockets:
+            ws.send(json.dumps({'subscriptionId': ids, 'imdata': [event]}))
+
+    def __store(self, mo):
+        cls, body = next(iter(mo.items()))
+        attributes = body.get('attributes', {})
+        dn = attributes.get('dn')
+        if dn is not None:
+            if 'deleted' in attributes.get('status', ''):
+                self.__delete(dn)
+            else:
+                with self.__lock:
+                    current = self.__classes.setdefault(cls, {}).get(dn)
+                    status = 'modified' if current else 'created'
+                    if current is None:
+                        current = self.__classes[cls][dn] = {cls: {'attributes': {}}}
+                        self.__dns[dn] = cls
+                    current[cls]['attributes'].update(
+                        {key: value for key, value in attributes.items() if key != 'status'})
+                self.push(current, status=status)
+                if cls == 'configExportP' and attributes.get('adminSt') == 'triggered':
+                    self.__export(current[cls]['attributes'])
+        for child in body.get('children', []):
+            self.__store(child)
+
+    def __export(self, policy):
+        # a triggered export runs a configJob, which succeeds after snapshot_duration
+        now = datetime.datetime.now(datetime.timezone.utc)
+        run = now.strftime('%Y-%m-%dT%H-%M-%S-%f')
+        file_name = f'ce2_{policy.get("name", "export")}-{run}.tar.gz'
+        job = {'dn': f'uni/backupst/jobs-[{policy["dn"]}]/run-{run}', 'operSt': 'running', 'fileName': '',
+               'executeTime': now.isoformat(), 'details': ''}
+        self.addMos('configJob', [job])
+
+        def finish():
+            with self.__lock:
+                self.__files[file_name] = self.snapshot_size
+                mo = self.__classes['configJob'].get(job['dn'])
+                if mo is not None:
+                    mo['configJob']['attributes'].update(operSt='success', fileName=file_name)
+
+        timer = threading.Timer(self.snapshot_duration, finish)
+        timer.daemon = True
+        timer.start()
+
+    def __delete(self, dn):
+        with self.__lock:
+            deleted = [d for d in self.__dns if d == dn or d.startswith(dn + '/')]
+            mos = [self.__classes[self.__dns[d]].pop(d) for d in deleted]
+            for d in deleted:
+                del self.__dns[d]
+        for mo in mos:
+            self.push(mo, status='deleted')
+        return mos
+
+    # ==============================================================================
+    # request handling
+    # ==============================================================================
+    def handle(self, request, method):
+        if request.headers.get('Upgrade', '').lower() == 'websocket':
+            return self.__websocket(request)
+
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b''
+        with self.__lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.__acquire():
+            with self.__lock:
+                self.throttled += 1
+            return self.__reply(request, 429, self.__error('429', 'Too many requests'),
+                                headers={'Retry-After': str(self.retry_after)})
+
+        url = urlparse(request.path)
+        path = unquote(url.path)
+        query = dict(parse_qsl(url.query))  # the last value of a repeated parameter wins
+        cookies = self.__cookies(request)
+
+        if path == '/api/aaaLogin.json' and method == 'POST':
+            return self.__login(request, body)
+        token = cookies.get('APIC-cookie')
+        with self.__lock:
+            authenticated = self.__tokens.get(token, 0) > time.monotonic()
+        # certificate based requests are signed, the signature isn't verified here
+        if not authenticated and 'APIC-Request-Signature' not in cookies:
+            return self.__reply(request, 403, self.__error('403', 'Token was invalid (Error: Token timeout)'))
+
+        if path == '/api/aaaRefresh.json':
+            return self.__login(request, None, old_token=token)
+        if path == '/api/aaaLogout.json':
+            with self.__lock:
+                self.__tokens.pop(token, None)
+                sockets = self.__sockets.pop(token, [])
+            for ws in sockets:
+                ws.close()
+            return self.__reply(request, 200, {'totalCount': '0', 'imdata': []})
+        if path in ('/api/subscriptionRefresh.json', '/api//subscriptionRefresh.json'):
+            with self.__lock:
+                known = query.get('id', '').isdigit() and int(query['id']) in self.__subscriptions
+            if not known:
+                return self.__reply(request, 400, self.__error('400', 'Subscription not found'))
+            return self.__reply(request, 200, {'totalCount': '0', 'imdata': []})
+
+        if method == 'GET' and path.startswith('/files/snapshots/'):
+            return self.__download(request, path[len('/files/snapshots/'):])
+        if method == 'GET' and path.startswith('/api/class/') and path.endswith('.json'):
+            cls = path[len('/api/class/'):-len('.json')]
+            with self.__lock:
+                objects = list(self.__classes.get(cls, {}).values())
+            return self.__query(request, objects, query, token, 'class', cls)
+        if path.startswith('/api/mo/') and path.endswith('.json'):
+            dn = path[len('/api/mo/'):-len('.json')]
+            if method == 'GET':
+                if query.get('query-target') in ('children', 'subtree'):
+                    return self.__query(request, self.__subtree(dn, query), query, token, 'mo', dn)
+                mo = self.getMo(dn)
+                return self.__query(request, [mo] if mo else [], query, token, 'mo', dn)
+            if method == 'DELETE':
+                self.__delete(dn)
+                return self.__reply(request, 200, {'totalCount': '0', 'imdata': []})
+        if method == 'POST' and path.startswith('/api/mo') and path.endswith('.json'):
+            try:
+                data = json.loads(body)
+            except ValueError:
+                return self.__reply(request, 400, self.__error('400', 'JSON parsing failed'))
+            for mo in data if isinstance(data, list) else [data]:
+                self.__store(mo)
+            return self.__reply(request, 200, {'totalCount': '0', 'imdata': []})
+
+        return self.__reply(request, 400, self.__error('400', f'Request failed, unresolved class for {path}'))
+
+    def __login(self, request, body, old_token=None):
+        if old_token is None:
+            try:
+                attributes = json.loads(body)['aaaUser']['attributes']
+            except (ValueError, KeyError, TypeError):
+                return self.__reply(request, 400, self.__error('400', 'JSON parsing failed'))
+            if attributes.get('name') != self.user or attributes.get('pwd') != self.password:
+                return self.__reply(request, 401, self.__error('401', 'Username or password is incorrect'))
+        token = secrets.token_urlsafe(24)
+        with self.__lock:
+            if old_token is not None:
+                self.__tokens.pop(old_token, None)
+                if old_token in self.__sockets:
+                    self.__sockets[token] = self.__sockets.pop(old_token)
+                for subscription_id, (owner, kind, name) in list(self.__subscriptions.items()):
+                    if owner == old_token:
+                        self.__subscriptions[subscription_id] = (token, kind, name)
+            self.__tokens[token] = time.monotonic() + self.refresh_timeout
+        login = {'aaaLogin': {'attributes': {'token': token, 'refreshTimeoutSeconds': str(self.refresh_timeout),
+                                             'userName': self.user}}}
+        return self.__reply(request, 200, {'totalCount': '1', 'imdata': [login]},
+                            headers={'Set-Cookie': f'APIC-cookie={token}; path=/; secure; HttpOnly'})
+
+    def __subtree(self, dn, query):
+        # children and subtree are treated alike, every object below dn matches
+        classes = query.get('target-subtree-class')
+        classes = set(classes.split(',')) if classes else None
+        with self.__lock:
+            return [self.__classes[cls][d] for d, cls in self.__dns.items()
+                    if d.startswith(dn + '/') and (classes is None or cls in classes)]
+
+    def __download(self, request, file_name):
+        with self.__lock:
+            size = self.__files.get(file_name)
+        if size is None:
+            return self.__reply(request, 404, self.__error('404', f'{file_name} not found'))
+        request.send_response(200)
+        request.send_header('Content-Type', 'application/octet-stream')
+        request.send_header('Content-Length', str(size))
+        request.end_headers()
+        chunk = b'\0' * 65536
+        for offset in range(0, size, len(chunk)):
+            request.wfile.write(chunk[:size - offset])
+
+    def __query(self, request, objects, query, token, kind, name):
+        total = len(objects)
+        if 'page-size' in query:
+            size = int(query['page-size'])
+            page = int(query.get('page', 0))
+            objects = objects[page * size:(page + 1) * size]
+        elif total > self.max_result:
+            return self.__reply(request, 400, self.__error('400', TOO_BIG))
+        response = {'totalCount': str(total), 'imdata': objects}
+        if query.get('subscription') == 'yes':
+            subscription_id = next(self.__subscription_ids)
+            with self.__lock:
+                self.__subscriptions[subscription_id] = (token, kind, name)
+            response['subscriptionId'] = str(subscription_id)
+        return self.__reply(request, 200, response)
+
+    def __acquire(self):
+        # token bucket holding up to one second of requests
+        if not self.rate_limit:
+            return True
+        with self.__lock:
+            now = time.monotonic()
+            tokens, last = self.__bucket or (self.rate_limit, now)
+            tokens = min(self.rate_limit, tokens + (now - last) * self.rate_limit)
+            if tokens < 1:
+                self.__bucket = (tokens, now)
+                return False
+            self.__bucket = (tokens - 1, now)
+            return True
+
+    def __websocket(self, request):
+        token = unquote(urlparse(request.path).path)[len('/socket'):]
+        with self.__lock:
+            valid = self.__tokens.get(token, 0) > time.monotonic()
+        if not valid or 'Sec-WebSocket-Key' not in request.headers:
+            return self.__reply(request, 403, self.__error('403', 'Token was invalid'))
+        accept = base64.b64encode(hashlib.sha1((request.headers['Sec-WebSocket-Key'] + WEBSOCKET_GUID)
+                                               .encode()).digest()).decode()
+        request.send_response(101, 'Switching Protocols')
+        request.send_header('Upgrade', 'websocket')
+        request.send_header('Connection', 'Upgrade')
+        request.send_header('Sec-WebSocket-Accept', accept)
+        request.end_headers()
+        request.wfile.flush()
+
+        ws = _WebSocket(request)
+        with self.__lock:
+            self.__sockets.setdefault(token, []).append(ws)
+        # the request thread keeps reading until the client closes the socket
+        ws.serve()
+        with self.__lock:
+            for sockets in self.__sockets.values():
+                if ws in sockets:
+                    sockets.remove(ws)
+        request.close_connection = True
+
+    def __reply(self, request, status, data, headers=None):
+        payload = json.dumps(data).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(payload)
+
+    @staticmethod
+    def __cookies(request):
+        cookies = {}
+        for cookie in request.headers.get_all('Cookie') or []:
+            for part in cookie.split(';'):
+                key, _, value = part.strip().partition('=')
+                cookies[key] = value
+        return cookies
+
+    @staticmethod
+    def __error(code, text):
+        return {'totalCount': '1', 'imdata': [{'error': {'attributes': {'code': code, 'text': text}}}]}
+
+    @staticmethod
+    def __selfSignedCert(directory):
+        key = crypto.PKey()
+        key.generate_key(crypto.TYPE_RSA, 2048)
+        cert = crypto.X509()
+        cert.get_subject().CN = 'apic-emulator'
+        cert.set_serial_number(int.from_bytes(os.urandom(8), 'big'))
+        cert.gmtime_adj_notBefore(0)
+        cert.gmtime_adj_notAfter(24 * 3600)
+        cert.set_issuer(cert.get_subject())
+        cert.set_pubkey(key)
+        cert.sign(key, 'sha256')
+        certfile = os.path.join(directory, 'emulator.crt')
+        keyfile = os.path.join(directory, 'emulator.key')
+        with open(certfile, 'wb') as f:
+            f.write(crypto.dump_certificate(crypto.FILETYPE_PEM, cert))
+        with open(keyfile, 'wb') as f:
+            f.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+        return certfile, keyfile
+
+
+class _WebSocket:
+    # server side of a websocket (RFC 6455), only sends unfragmented text frames
+
+    def __init__(self, request):
+        self.request = request
+        self.__lock = threading.Lock()
+        self.closed = False
+
+    def send(self, text):
+        payload = text.encode()
+        header = bytes([0x81])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 2 ** 16:
+            header += bytes([126]) + struct.pack('!H', len(payload))
+        else:
+            header += bytes([127]) + struct.pack('!Q', len(payload))
+        with self.__lock:
+            if self.closed:
+                return
+            try:
+                self.request.wfile.write(header + payload)
+                self.request.wfile.flush()
+            except OSError:
+                self.closed = True
+
+    def close(self):
+        with self.__lock:
+            if not self.closed:
+                self.closed = True
+                try:
+                    self.request.wfile.write(bytes([0x88, 0]))
+                    self.request.wfile.flush()
+                    self.request.connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def serve(self):
+        rfile = self.request.rfile
+        while not self.closed:
+            try:
+                head = rfile.read(2)
+                if len(head) < 2:
+                    break
+                opcode, length = head[0] & 0x0f, head[1] & 0x7f
+                if length == 126:
+                    length = struct.unpack('!H', rfile.read(2))[0]
+                elif length == 127:
+                    length = struct.unpack('!Q', rfile.read(8))[0]
+                # client frames are masked, the payload itself isn't needed
+                rfile.read(length + (4 if head[1] & 0x80 else 0))
+            except OSError:
+                break
+            if opcode == 0x8:
+                break
+            # a ping is answered with an empty pong
+            if opcode == 0x9:
+                with self.__lock:
+                    try:
+                        self.request.wfile.write(bytes([0x8a, 0]))
+                        self.request.wfile.flush()
+                    except OSError:
+                        break
+        self.close()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#
+# MIT License
+# Copyright (c) 2020 Netcloud AG
+
+"""EventPipeline
+
+Decouples the websocket of a subscription from the user handler. Events are
+coalesced per DN while they wait, so a burst of updates on the same object
+is merged into one event, and are handed to the handler in batches from a
+separate thread. A slow handler fills the pipeline instead of stalling the
+socket; what happens when it is full is chosen by the policy.
+"""
+import logging
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+
+POLICY_BLOCK = 'block'
+POLICY_DROP = 'drop'
+POLICY_DROP_OLDEST = 'drop-oldest'
+
+
+class EventPipeline:
+    __logger = logging.getLogger(__name__)
+
+    # ==============================================================================
+    # constructor
+    # ==============================================================================
+    def __init__(self, handler, max_pending=10000, window=0.5, batch_size=500, policy=POLICY_BLOCK,
+                 block_timeout=None):
+        self.__logger.debug(f'Constructor called max_pending: {max_pending} window: {window} policy: {policy}')
+        if policy not in (POLICY_BLOCK, POLICY_DROP, POLICY_DROP_OLDEST):
+            raise ValueError(f'unknown policy: {policy}')
+        self.handler = handler
+        self.max_pending = max_pending
+        self.window = window  # in seconds; how long an event waits for newer states of its DN
+        self.batch_size = batch_size
+        self.policy = policy
+        self.block_timeout = block_timeout  # in seconds; None blocks until there is space
+
+        self.__pending = OrderedDict()
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__running = False
+        self.__anonymous = itertools.count()
+        self.__counters = {'received': 0, 'coalesced': 0, 'dropped': 0, 'delivered': 0, 'batches': 0,
+                           'handler_errors': 0}
+        self.__lag = 0.0
+        self.__max_lag = 0.0
+
+    # ==============================================================================
+    # start
+    # ==============================================================================
+    def start(self):
+        self.__logger.debug('start called')
+        with self.__condition:
+            if self.__running:
+                return self
+            self.__running = True
+        self.__thread = threading.Thread(target=self.__run, name='aciClient-events', daemon=True)
+        self.__thread.start()
+        return self
+
+    # ==============================================================================
+    # stop
+    # ==============================================================================
+    def stop(self):
+        """stop the pipeline after delivering all pending events"""
+        self.__logger.debug('stop called')
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify_all()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    # ==============================================================================
+    # on_message
+    # ==============================================================================
+    def on_message(self, ws, message):
+        """websocket-client callback, submits every MO of a push message"""
+        for mo in json.loads(message).get('imdata', []):
+            self.submit(mo)
+
+    # ==============================================================================
+    # submit
+    # ==============================================================================
+    def submit(self, mo) -> bool:
+        """queue a MO like {'faultInst': {'attributes': {...}}}, returns False if it was dropped"""
+        attributes = next(iter(mo.values())).get('attributes', {})
+        # events without a dn can't be coalesced
+        key = attributes.get('dn') or f'#{next(self.__anonymous)}'
+
+        with self.__condition:
+            self.__counters['received'] += 1
+            if key in self.__pending:
+                self.__counters['coalesced'] += 1
+                self.__pending[key] = (self.__pending[key][0], self.__merge(self.__pending[key][1], mo))
+                return True
+
+            if len(self.__pending) >= self.max_pending:
+                if self.policy == POLICY_DROP:
+                    self.__counters['dropped'] += 1
+                    return False
+                elif self.policy == POLICY_DROP_OLDEST:
+                    self.__counters['dropped'] += 1
+                    self.__pending.popitem(last=False)
+                else:
+                    has_space = self.__condition.wait_for(lambda: len(self.__pending) < self.max_pending,
+                                                          timeout=self.block_timeout)
+                    if not has_space:
+                        self.__counters['dropped'] += 1
+                        return False
+                    if key in self.__pending:
+                        self.__counters['coalesced'] += 1
+                        self.__pending[key] = (self.__pending[key][0], self.__merge(self.__pending[key][1], mo))
+                        return True
+
+            self.__pending[key] = (time.monotonic(), mo)
+            # the worker only needs a wake up for the first event or a full batch
+            if len(self.__pending) == 1 or len(self.__pending) == self.batch_size:
+                self.__condition.notify_all()
+        return True
+
+    # ==============================================================================
+    # stats
+    # ==============================================================================
+    def stats(self) -> {}:
+        with self.__condition:
+            stats = dict(self.__counters)
+            stats['pending'] = len(self.__pending)
+            stats['lag'] = self.__lag
+            stats['max_lag'] = self.__max_lag
+            if self.__pending:
+                stats['oldest_pending'] = time.monotonic() - next(iter(self.__pending.values()))[0]
+            else:
+                stats['oldest_pending'] = 0.0
+        return stats
+
+    @staticmethod
+    def __merge(pending, mo):
+        # events of modified objects only carry the dn and the attributes that changed
+        cls, body = next(iter(mo.items()))
+        attributes = body.get('attributes', {})
+        pending_attributes = next(iter(pending.values())).get('attributes', {})
+        pending_status = pending_attributes.get('status', '')
+        status = attributes.get('status', '')
+
+        if 'deleted' in pending_status and 'created' in status:
+            # deleted and created again, nothing of the old object is left
+            return mo
+        merged = dict(pending_attributes)
+        merged.update(attributes)
+        if 'deleted' in status:
+            merged['status'] = status
+        elif 'created' in pending_status or 'deleted' in pending_status:
+            # a new object stays created, a deleted one stays deleted
+            merged['status'] = pending_status
+        return {cls: dict(body, attributes=merged)}
+
+    def __next_batch(self):
+        with self.__condition:
+            while True:
+                if not self.__pending:
+                    if not self.__running:
+                        return None
+                    self.__condition.wait()
+                    continue
+                oldest = next(iter(self.__pending.values()))[0]
+                wait = oldest + self.window - time.monotonic()
+                if self.__running and wait > 0 and len(self.__pending) < self.batch_size:
+                    self.__condition.wait(wait)
+                    continue
+                break
+
+            batch = []
+            while self.__pending and len(batch) < self.batch_size:
+                batch.append(self.__pending.popitem(last=False)[1][1])
+            self.__lag = time.monotonic() - oldest
+            self.__max_lag = max(self.__max_lag, self.__lag)
+            self.__counters['batches'] += 1
+            self.__counters['delivered'] += len(batch)
+            # wake up producers blocked on a full pipeline
+            self.__condition.notify_all()
+        return batch
+
+    def __run(self):
+        while True:
+            batch = self.__next_batch()
+            if batch is None:
+                return
+            try:
+                self.handler(batch)
+            except Exception as e:
+                self.__logger.exception(f'Event handler failed: {e}')
+                with self.__condition:
+                    self.__counters['handler_errors'] += 1
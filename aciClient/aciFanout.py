@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# MIT License
+# Copyright (c) 2020 Netcloud AG
+
+"""ACIFanout
+
+Run the same query against many APICs at the same time and stream the merged
+results, tagged with the fabric name.
+
+Inventory (JSON):
+[
+    {"name": "fab1", "apicIp": "apic1.example.com", "apicUser": "admin", "apicPassword": "secret"},
+    {"name": "fab2", "apicIp": "apic2.example.com", "apicUser": "admin", "apicPasswordEnv": "FAB2_PASSWORD"}
+]
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+from aciClient.aci import ACI
+
+
+class ACIFanout:
+    __logger = logging.getLogger(__name__)
+
+    # ==============================================================================
+    # constructor
+    # ==============================================================================
+    def __init__(self, fabrics, max_workers=16, timeout=60, retries=2, scheduler=None):
+        self.__logger.debug(f'Constructor called with {len(fabrics)} fabrics')
+        self.fabrics = {}
+        self.timeouts = {}
+        for fabric in fabrics:
+            name = fabric.get('name', fabric['apicIp'])
+            password = fabric.get('apicPassword')
+            if password is None and 'apicPasswordEnv' in fabric:
+                password = os.environ.get(fabric['apicPasswordEnv'])
+            aci = ACI(fabric['apicIp'], fabric['apicUser'], password, refresh=scheduler is not None,
+                      proxies=fabric.get('proxies'), scheduler=scheduler)
+            fabric_timeout = fabric.get('timeout', timeout)
+            fabric_retries = fabric.get('retries', retries)
+            # all attempts of a request together stay close to the fabric timeout
+            aci.total_retry_attempts = fabric_retries
+            aci.retry_backoff_factor = fabric_timeout / 20
+            aci.request_timeout = fabric_timeout / (fabric_retries + 1)
+            self.fabrics[name] = aci
+            self.timeouts[name] = fabric_timeout
+        self.max_workers = max_workers
+        self.clients = {}
+
+    # ==============================================================================
+    # fromInventory
+    # ==============================================================================
+    @classmethod
+    def fromInventory(cls, path, **kwargs):
+        with open(path, encoding='utf-8') as f:
+            inventory = json.load(f)
+        if isinstance(inventory, dict):
+            inventory = inventory['fabrics']
+        return cls(inventory, **kwargs)
+
+    # ==============================================================================
+    # login
+    # ==============================================================================
+    def login(self) -> {}:
+        """log in to all fabrics at the same time, returns {name: error or None}"""
+        self.__logger.debug('login called')
+        errors = {}
+        for name, result in self.__fanout(self.fabrics, lambda aci: aci.login(), late=self.__lateLogin):
+            if result is True:
+                self.clients[name] = self.fabrics[name]
+                errors[name] = None
+            elif result is False:
+                errors[name] = 'login failed'
+            else:
+                errors[name] = result['error']
+        self.__logger.info(f'Logged in to {len(self.clients)} of {len(self.fabrics)} fabrics')
+        return errors
+
+    def __lateLogin(self, name, aci, result):
+        # the fabric already timed out, a session it opened now would never be logged out or stop refreshing
+        if result is not True:
+            return
+        self.__logger.warning(f'Login to {name} finished after the timeout, logging out again')
+        try:
+            aci.logout()
+        except Exception as e:
+            self.__logger.error(f'Logout from {name} failed: {e}')
+
+    # ==============================================================================
+    # logout
+    # ==============================================================================
+    def logout(self):
+        self.__logger.debug('logout called')
+        for name, result in self.__fanout(self.clients, lambda aci: aci.logout()):
+            if isinstance(result, dict):
+                self.__logger.warning(f'Logout from {name} failed: {result["error"]}')
+        self.clients = {}
+
+    # ==============================================================================
+    # query
+    # ==============================================================================
+    def query(self, uri):
+        """yield the MOs of uri from every logged in fabric, as soon as each fabric answers"""
+        self.__logger.debug(f'query called uri: {uri}')
+        for name, result in self.__fanout(self.clients, lambda aci: aci.getJson(uri)):
+            if isinstance(result, list):
+                for mo in result:
+                    yield {'fabric': name, **mo}
+            else:
+                # getJson returns the error text or the error response instead of imdata
+                error = result.get('error', result) if isinstance(result, dict) else result
+                yield {'fabric': name, 'error': error}
+
+    def __fanout(self, clients, call, late=None):
+        # yields (name, result) in completion order; exceptions and timeouts become {'error': ...}
+        # every call runs on its own daemon thread. A timed out call can't be interrupted, but it no longer
+        # counts against max_workers, so stuck fabrics never hold back the others or later calls.
+        # late(name, aci, result) gets the result of a call that finishes after its fabric timed out.
+        results = queue.Queue()
+        waiting = deque(clients.items())
+        running = {}
+        lock = threading.Lock()
+        finished = set()
+        expired = set()
+
+        def run(name, aci):
+            try:
+                result, error = call(aci), None
+            except Exception as e:
+                result, error = None, e
+            with lock:
+                in_time = name not in expired
+                if in_time:
+                    finished.add(name)
+            if in_time:
+                results.put((name, result, error))
+            elif late is not None and error is None:
+                late(name, aci, result)
+
+        while waiting or running:
+            while waiting and len(running) < self.max_workers:
+                name, aci = waiting.popleft()
+                running[name] = time.monotonic() + self.timeouts[name]
+                threading.Thread(target=run, args=(name, aci), name=f'aciClient-fanout-{name}', daemon=True).start()
+
+            try:
+                name, result, error = results.get(timeout=max(0, min(running.values()) - time.monotonic()))
+            except queue.Empty:
+                name = None
+            if name is not None:
+                del running[name]
+                if error is not None:
+                    self.__logger.error(f'Error on fabric {name}: {error}')
+                    yield name, {'error': str(error)}
+                else:
+                    yield name, result
+
+            now = time.monotonic()
+            for name, deadline in list(running.items()):
+                if now >= deadline:
+                    with lock:
+                        # a finished call is already in the queue, its result is still used
+                        if name in finished:
+                            continue
+                        expired.add(name)
+                    del running[name]
+                    self.__logger.error(f'Timeout on fabric {name} after {self.timeouts[name]}s')
+                    yield name, {'error': f'timeout after {self.timeouts[name]}s'}
+
+
+# ==============================================================================
+# main
+# ==============================================================================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Run an APIC query against many fabrics and print NDJSON')
+    parser.add_argument('inventory', help='JSON inventory of fabrics')
+    parser.add_argument('uri', nargs='+', help='query uri, e.g. class/faultInst.json')
+    parser.add_argument('-w', '--workers', type=int, default=16, help='fabrics queried at the same time')
+    parser.add_argument('-t', '--timeout', type=float, default=60, help='per-fabric timeout in seconds')
+    parser.add_argument('-r', '--retries', type=int, default=2, help='retries of a failed request per fabric')
+    parser.add_argument('-o', '--output', help='write NDJSON to this file instead of stdout')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    fanout = ACIFanout.fromInventory(args.inventory, max_workers=args.workers, timeout=args.timeout,
+                                     retries=args.retries)
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    failed = False
+    try:
+        for name, error in fanout.login().items():
+            if error is not None:
+                failed = True
+                out.write(json.dumps({'fabric': name, 'error': error}) + '\n')
+        for uri in args.uri:
+            for record in fanout.query(uri):
+                if 'error' in record:
+                    failed = True
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+        fanout.logout()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
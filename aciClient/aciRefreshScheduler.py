@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+# MIT License
+# Copyright (c) 2020 Netcloud AG
+
+"""RefreshScheduler
+
+Shared token refresh scheduler for many ACI sessions. One thread keeps the
+expiry of all registered sessions in a heap and hands due refreshes to a
+bounded worker pool.
+"""
+import logging
+import heapq
+import itertools
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RefreshScheduler:
+    __logger = logging.getLogger(__name__)
+
+    # ==============================================================================
+    # constructor
+    # ==============================================================================
+    def __init__(self, max_workers=8, jitter=10, retry_interval=30, timeout=30):
+        self.__logger.debug(f'Constructor called max_workers: {max_workers} jitter: {jitter}')
+        self.max_workers = max_workers
+        self.jitter = jitter  # in seconds; refreshes are pulled forward by up to this value
+        self.retry_interval = retry_interval  # in seconds; delay after a failed re-login
+        self.timeout = timeout  # in seconds; of the aaaRefresh and aaaLogin requests made by the scheduler
+
+        self.__heap = []
+        self.__due = {}
+        self.__inflight = set()
+        # unregister bumps the generation of a session, a refresh started before that can't register it again
+        self.__generations = weakref.WeakKeyDictionary()
+        self.__local = threading.local()
+        self.__counter = itertools.count()
+        self.__condition = threading.Condition()
+        self.__executor = None
+        self.__thread = None
+        self.__running = False
+        self.__closed = False
+
+    # ==============================================================================
+    # register
+    # ==============================================================================
+    def register(self, aci, delay) -> None:
+        """schedule a refresh of aci in delay seconds (minus a random jitter)"""
+        delay = max(0, delay - random.uniform(0, self.jitter))
+        due = time.monotonic() + delay
+        self.__logger.debug(f'scheduling refresh of {aci.apicIp} in {delay:.1f}s')
+        with self.__condition:
+            if self.__closed:
+                # a refresh still running during close must not start the scheduler again
+                self.__logger.debug(f'scheduler closed, not scheduling {aci.apicIp}')
+                return
+            generation = getattr(self.__local, 'generation', None)
+            if generation is not None and generation != self.__generations.get(aci, 0):
+                self.__logger.debug(f'{aci.apicIp} was unregistered during refresh, not scheduling it again')
+                return
+            self.__inflight.discard(aci)
+            self.__due[aci] = due
+            heapq.heappush(self.__heap, (due, next(self.__counter), aci))
+            self.__start()
+            self.__condition.notify()
+
+    # ==============================================================================
+    # unregister
+    # ==============================================================================
+    def unregister(self, aci) -> None:
+        self.__logger.debug(f'unregister {aci.apicIp}')
+        with self.__condition:
+            # heap entries of unregistered sessions are skipped when they are popped
+            self.__due.pop(aci, None)
+            self.__inflight.discard(aci)
+            self.__generations[aci] = self.__generations.get(aci, 0) + 1
+            self.__condition.notify()
+
+    # ==============================================================================
+    # sessions
+    # ==============================================================================
+    def sessions(self) -> int:
+        with self.__condition:
+            return len(self.__due) + len(self.__inflight)
+
+    # ==============================================================================
+    # close
+    # ==============================================================================
+    def close(self) -> None:
+        self.__logger.debug('close called')
+        with self.__condition:
+            self.__closed = True
+            self.__running = False
+            self.__heap.clear()
+            self.__due.clear()
+            self.__inflight.clear()
+            self.__condition.notify()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+            self.__executor = None
+
+    def __start(self):
+        # called with the condition held, never after close
+        if self.__running or self.__closed:
+            return
+        self.__running = True
+        self.__executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.__thread = threading.Thread(target=self.__run, name='aciClient-refresh', daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        with self.__condition:
+            while self.__running:
+                if not self.__heap:
+                    self.__condition.wait()
+                    continue
+                due, _, aci = self.__heap[0]
+                if self.__due.get(aci) != due:
+                    # stale entry, the session was rescheduled or unregistered
+                    heapq.heappop(self.__heap)
+                    continue
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self.__condition.wait(wait)
+                    continue
+                heapq.heappop(self.__heap)
+                del self.__due[aci]
+                self.__inflight.add(aci)
+                self.__executor.submit(self.__refresh, aci, self.__generations.get(aci, 0))
+
+    def __refresh(self, aci, generation):
+        # renewCookie and login call register from this thread, it checks the generation against unregister
+        self.__local.generation = generation
+        try:
+            self.__renew(aci)
+        finally:
+            self.__local.generation = None
+
+    def __renew(self, aci):
+        try:
+            # on success renewCookie registers the next refresh itself
+            if aci.renewCookie(timeout=self.timeout):
+                return
+        except Exception as e:
+            self.__logger.warning(f'Could not renew token of {aci.apicIp}: {e}')
+
+        if not self.__registered(aci):
+            self.__logger.debug(f'{aci.apicIp} was unregistered during refresh')
+            return
+
+        # refresh_auto is left alone, after a logout the login doesn't register the session again
+        self.__logger.info(f'Falling back to re-login on {aci.apicIp}')
+        try:
+            if aci.login(timeout=self.timeout):
+                return
+        except Exception as e:
+            self.__logger.error(f'Re-login to {aci.apicIp} failed: {e}')
+
+        if self.__registered(aci) and aci.refresh_auto:
+            self.register(aci, self.retry_interval + self.jitter)
+
+    def __registered(self, aci):
+        with self.__condition:
+            return aci in self.__inflight and self.__local.generation == self.__generations.get(aci, 0)
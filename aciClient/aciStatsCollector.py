@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+#
+# MIT License
+# Copyright (c) 2020 Netcloud AG
+
+"""StatsCollector
+
+Polls APIC statistics classes and keeps the cumulative counters of every DN in
+NumPy ring buffers. Rates, percentiles and counter wraps are computed on whole
+arrays, and the buffered series can be read without querying the APIC again.
+A counter that goes down was reset (clear counters, reload) unless it wrapped
+around counter_bits, and the rate of that interval is NaN.
+
+Needs numpy: pip install aciClient[stats]
+"""
+import logging
+import threading
+import time
+import warnings
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# cumulative counters polled for each stats class unless others are configured
+DEFAULT_COUNTERS = {
+    'eqptIngrBytes5min': ['unicastCum', 'multicastCum', 'floodCum'],
+    'eqptEgrTotal15min': ['bytesCum', 'pktsCum'],
+    'l2IngrBytesAg15min': ['unicastCum', 'multicastCum', 'floodCum'],
+}
+
+
+class _SeriesRing:
+    # samples of one stats class: one row per DN, one column per poll
+
+    def __init__(self, counters, capacity):
+        self.counters = counters
+        self.capacity = capacity
+        self.dns = []
+        self.rows = {}
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = {counter: np.zeros((0, capacity), dtype=np.uint64) for counter in counters}
+        self.valid = np.zeros((0, capacity), dtype=bool)
+        self.head = 0
+        self.count = 0
+
+    def __grow(self, rows):
+        size = max(rows, 2 * self.valid.shape[0], 64)
+        for counter, values in self.values.items():
+            grown = np.zeros((size, self.capacity), dtype=np.uint64)
+            grown[:values.shape[0]] = values
+            self.values[counter] = grown
+        grown = np.zeros((size, self.capacity), dtype=bool)
+        grown[:self.valid.shape[0]] = self.valid
+        self.valid = grown
+
+    def append(self, timestamp, dns, columns):
+        rows = np.empty(len(dns), dtype=np.intp)
+        for i, dn in enumerate(dns):
+            row = self.rows.get(dn)
+            if row is None:
+                row = self.rows[dn] = len(self.dns)
+                self.dns.append(dn)
+            rows[i] = row
+        if len(self.dns) > self.valid.shape[0]:
+            self.__grow(len(self.dns))
+
+        column = self.head
+        self.times[column] = timestamp
+        self.valid[:, column] = False
+        self.valid[rows, column] = True
+        for counter, values in columns.items():
+            self.values[counter][rows, column] = values
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def order(self):
+        # ring columns from the oldest to the newest sample
+        return (self.head - self.count + np.arange(self.count)) % self.capacity
+
+    def series(self, counter):
+        order = self.order()
+        rows = len(self.dns)
+        return self.times[order], self.values[counter][:rows, order], self.valid[:rows, order]
+
+
+class StatsCollector:
+    __logger = logging.getLogger(__name__)
+
+    # ==============================================================================
+    # constructor
+    # ==============================================================================
+    def __init__(self, aci, counters=None, capacity=288, interval=300, counter_bits=64):
+        self.__logger.debug(f'Constructor called capacity: {capacity} interval: {interval}')
+        if np is None:
+            raise ImportError('StatsCollector needs numpy, install it with: pip install aciClient[stats]')
+        self.aci = aci
+        self.counters = counters if counters is not None else DEFAULT_COUNTERS
+        self.capacity = capacity  # samples kept per DN
+        self.interval = interval  # in seconds
+        self.counter_bits = counter_bits  # width of the APIC counters, used to tell wraps from resets
+
+        self.__rings = {cls: _SeriesRing(counters, capacity) for cls, counters in self.counters.items()}
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    # ==============================================================================
+    # poll
+    # ==============================================================================
+    def poll(self) -> bool:
+        """query every stats class once and append the samples, returns False if a query failed"""
+        self.__logger.debug('poll called')
+        success = True
+        for cls, counters in self.counters.items():
+            timestamp = time.time()
+            imdata = self.aci.getJson(f'class/{cls}.json')
+            if not isinstance(imdata, list):
+                self.__logger.error(f'Could not poll {cls}: {imdata}')
+                success = False
+                continue
+
+            attributes = [mo[cls]['attributes'] for mo in imdata if cls in mo]
+            dns = [attribute['dn'] for attribute in attributes]
+            columns = {counter: np.fromiter((int(attribute.get(counter, 0)) for attribute in attributes),
+                                            dtype=np.uint64, count=len(attributes))
+                       for counter in counters}
+            with self.__lock:
+                self.__rings[cls].append(timestamp, dns, columns)
+            self.__logger.debug(f'Polled {len(dns)} {cls} objects')
+        return success
+
+    # ==============================================================================
+    # start
+    # ==============================================================================
+    def start(self):
+        self.__logger.debug(f'start called, polling every {self.interval}s')
+        if self.__thread is not None:
+            return self
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, name='aciClient-stats', daemon=True)
+        self.__thread.start()
+        return self
+
+    # ==============================================================================
+    # stop
+    # ==============================================================================
+    def stop(self):
+        self.__logger.debug('stop called')
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    # ==============================================================================
+    # series
+    # ==============================================================================
+    def series(self, cls, counter):
+        """buffered samples as (dns, times, values); values is a float array with NaN for missing samples"""
+        with self.__lock:
+            ring = self.__rings[cls]
+            times, values, valid = ring.series(counter)
+            dns = list(ring.dns)
+            values = values.astype(np.float64)
+        values[~valid] = np.nan
+        return dns, times, values
+
+    # ==============================================================================
+    # latest
+    # ==============================================================================
+    def latest(self, cls, counter):
+        """the newest value of every DN as (dns, values)"""
+        dns, _, values = self.series(cls, counter)
+        if values.shape[1] == 0:
+            return dns, np.full(len(dns), np.nan)
+        return dns, values[:, -1]
+
+    # ==============================================================================
+    # rates
+    # ==============================================================================
+    def rates(self, cls, counter):
+        """per second rates between consecutive samples as (dns, times, rates), NaN where a counter was reset"""
+        with self.__lock:
+            ring = self.__rings[cls]
+            times, values, valid = ring.series(counter)
+            dns = list(ring.dns)
+            reset = values[:, 1:] < values[:, :-1]
+            # uint64 subtraction wraps modulo 2**64, masked it is the delta of a wrapped narrower counter
+            delta = values[:, 1:] - values[:, :-1]
+        if self.counter_bits < 64:
+            delta &= np.uint64((1 << self.counter_bits) - 1)
+            # a wrap only counts if the counter went less than half around, a bigger drop is a reset
+            reset &= delta >= np.uint64(1 << (self.counter_bits - 1))
+        elapsed = np.diff(times)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = delta.astype(np.float64) / elapsed
+        rates[reset | ~(valid[:, 1:] & valid[:, :-1])] = np.nan
+        return dns, times[1:], rates
+
+    # ==============================================================================
+    # percentiles
+    # ==============================================================================
+    def percentiles(self, cls, counter, q=(50, 95, 99)):
+        """rate percentiles of every DN as (dns, array of shape (len(dns), len(q)))"""
+        dns, _, rates = self.rates(cls, counter)
+        if rates.shape[1] == 0:
+            return dns, np.full((len(dns), len(q)), np.nan)
+        with warnings.catch_warnings():
+            # DNs without two consecutive samples only have NaN rates
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return dns, np.nanpercentile(rates, q, axis=1).T
+
+    def __run(self):
+        while not self.__stop.is_set():
+            started = time.monotonic()
+            try:
+                self.poll()
+            except Exception as e:
+                self.__logger.exception(f'Polling stats failed: {e}')
+            self.__stop.wait(max(0, self.interval - (time.monotonic() - started)))
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# MIT License
+# Copyright (c) 2020 Netcloud AG
+
+"""aciClient throughput benchmark
+
+Runs the client against the local APIC emulator and reports requests per
+second, latency percentiles and peak memory for getJson, getJsonPaged,
+postJson, deleteMo and the ACICert request signing.
+
+    python benchmarks/bench_client.py --objects 20000 --iterations 20
+    python benchmarks/bench_client.py --output baseline.json
+    python benchmarks/bench_client.py --compare baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from OpenSSL import crypto
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from aciClient import ACI, ACICert  # noqa: E402
+from aciClient.aciEmulator import APICEmulator  # noqa: E402
+
+
+def endpoint(i):
+    return {'dn': f'uni/tn-bench/ap-app/epg-epg{i % 100}/cep-00:00:00:{i // 65536 % 256:02X}:'
+                  f'{i // 256 % 256:02X}:{i % 256:02X}',
+            'mac': f'00:00:00:{i // 65536 % 256:02X}:{i // 256 % 256:02X}:{i % 256:02X}',
+            'ip': f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}',
+            'encap': f'vlan-{100 + i % 100}', 'lcC': 'learned',
+            'fabricPathDn': 'topology/pod-1/paths-101/pathep-[eth1/1]',
+            'modTs': '2024-06-01T12:00:00.000+00:00', 'status': ''}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def measure(name, call, iterations, results):
+    # warm up connections and caches before timing
+    call(0)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        begin = time.perf_counter()
+        call(i + 1)
+        latencies.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - start
+
+    # memory is measured in a separate call, tracemalloc slows down the timed ones
+    tracemalloc.start()
+    call(iterations + 1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    results[name] = {
+        'iterations': iterations,
+        'rps': iterations / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'peak_mb': peak / 2 ** 20,
+    }
+    print(f'{name:<14} {results[name]["rps"]:>10.1f} {results[name]["p50_ms"]:>9.2f} '
+          f'{results[name]["p90_ms"]:>9.2f} {results[name]["p99_ms"]:>9.2f} {results[name]["peak_mb"]:>9.1f}')
+
+
+def run(args):
+    results = {}
+    with APICEmulator(latency=args.latency, max_result=args.objects) as emulator:
+        emulator.addMos('fvCEp', [endpoint(i) for i in range(args.objects)])
+        aci = ACI(emulator.address, 'admin', 'password')
+        aci.login()
+
+        print(f'{args.objects} fvCEp objects, {args.iterations} iterations, {args.latency * 1000:.0f}ms latency')
+        print(f'{"operation":<14} {"req/s":>10} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"peak MB":>9}')
+
+        def getJson(i):
+            assert len(aci.getJson('class/fvCEp.json')) == args.objects
+
+        def getJsonPaged(i):
+            assert len(aci.getJsonPaged('class/fvCEp.json')) == args.objects
+
+        def postJson(i):
+            assert aci.postJson({'fvTenant': {'attributes': {'dn': f'uni/tn-bench{i}', 'descr': 'benchmark'}}}) == 200
+
+        def deleteMo(i):
+            aci.postJson({'fvTenant': {'attributes': {'dn': f'uni/tn-delete{i}'}}})
+            assert aci.deleteMo(f'uni/tn-delete{i}') == 200
+
+        measure('getJson', getJson, args.iterations, results)
+        measure('getJsonPaged', getJsonPaged, args.iterations, results)
+        measure('postJson', postJson, args.iterations * 10, results)
+        measure('deleteMo', deleteMo, args.iterations * 10, results)
+        aci.logout()
+
+        with tempfile.TemporaryDirectory() as directory:
+            key = crypto.PKey()
+            key.generate_key(crypto.TYPE_RSA, 2048)
+            key_path = os.path.join(directory, 'bench.key')
+            with open(key_path, 'wb') as f:
+                f.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+            cert = ACICert(emulator.address, key_path, 'uni/userext/user-bench/usercert-bench')
+            payload = json.dumps({'fvTenant': {'attributes': {'dn': 'uni/tn-bench', 'descr': 'x' * 200}}})
+
+            def sign(i):
+                cert.packCookies('POST/api/mo.json' + payload)
+
+            measure('ACICert.sign', sign, args.iterations * 50, results)
+    return results
+
+
+def compare(results, baseline, tolerance) -> bool:
+    ok = True
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = result['rps'] / baseline[name]['rps'] - 1
+        regressed = change < -tolerance
+        ok = ok and not regressed
+        print(f'{name:<14} {change * 100:>+7.1f}% req/s {"REGRESSION" if regressed else ""}')
+    return ok
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='aciClient benchmark against the local APIC emulator')
+    parser.add_argument('--objects', type=int, default=20000, help='fvCEp objects returned by the class queries')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.0, help='emulated APIC latency in seconds')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed req/s drop against --compare')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run(args)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            return 0 if compare(results, json.load(f), args.tolerance) else 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
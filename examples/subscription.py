@@ -3,14 +3,15 @@ import time
 import ssl
 from threading import Thread
 
-from aciClient import ACI
+from aciClient import ACI, EventPipeline
 import websocket
 
 
-def on_message(ws, message):
-    print("Websocket received a message")
-    # Message contains the data transmited from ACI in plaintext
-    print(json.loads(message)["imdata"])
+def handle_events(events):
+    # Called from the pipeline thread with the latest state of every changed object
+    print(f"Received {len(events)} events")
+    for event in events:
+        print(json.dumps(event))
 
 
 def on_close(ws, close_status_code, close_msg):
@@ -21,10 +22,11 @@ def on_open(ws):
     print("Websocket was opened")
 
 
-def open_websocket(ip: str, token: str):
+def open_websocket(ip: str, token: str, pipeline: EventPipeline):
     ws = websocket.WebSocketApp(
         f"wss://{ip}/socket{token}",
-        on_message=on_message,
+        # The pipeline queues the messages, a slow handler doesn't stall the socket
+        on_message=pipeline.on_message,
         on_open=on_open,
         on_close=on_close,
     )
@@ -41,9 +43,13 @@ def main():
     # Login to ACI
     aci.login()
 
+    # Coalesce updates per DN for 1s and deliver them in batches of up to 500 events
+    pipeline = EventPipeline(handle_events, window=1, batch_size=500, policy="drop-oldest")
+    pipeline.start()
+
     # Open websocket to ACI with the login token
 
-    Thread(target=open_websocket, args=(aci.apicIp, aci.token)).start()
+    Thread(target=open_websocket, args=(aci.apicIp, aci.token, pipeline)).start()
     time.sleep(5)
 
     # Subscribe to an ACI object
@@ -60,7 +66,7 @@ def main():
 
     while True:
         time.sleep(30)
-        print("Refreshing subscription")
+        print(f"Refreshing subscription, pipeline stats: {pipeline.stats()}")
         aci.subscription_refresh(subscription_id=subscription_id)
 
 
@@ -15,7 +15,9 @@ setup(name='aciClient',
       license='MIT',
       packages=['aciClient'],
       install_requires=['requests[socks]>=2.26.0 , <3', 'pyOpenSSL>=23.0.0, <26', 'PySocks>=1.7.1, <2'],
+      extras_require={'stats': ['numpy>=1.19']},
       long_description=long_description,
       long_description_content_type='text/markdown',
       python_requires=">=3.6",
+      entry_points={'console_scripts': ['aciclient-fanout=aciClient.aciFanout:main']},
       zip_safe=False)
@@ -6,6 +6,8 @@
 """AciClient Testing
 
 """
+import io
+
 from requests import RequestException
 
 from aciClient.aci import ACI
@@ -280,3 +282,88 @@ def test_snapshot_tenant_nok(requests_mock):
     aci.login()
     resp = aci.snapshot(description='unit_test', target_dn='/uni/tn-test')
     assert not resp
+
+
+def test_snapshot_job_download_ok(requests_mock, tmp_path):
+    jobs_url = (f'https://{__BASE_URL}/api/mo/uni/backupst/jobs-%5Buni/fabric/configexp-aciclient%5D.json'
+                f'?query-target=children&target-subtree-class=configJob')
+    old_job = {'configJob': {'attributes': {'dn': 'run-old', 'operSt': 'success', 'fileName': 'old.tar.gz',
+                                            'executeTime': '2024-01-01T00:00:00'}}}
+    new_job = {'configJob': {'attributes': {'dn': 'run-new', 'operSt': 'running', 'fileName': '',
+                                            'executeTime': '2024-06-01T00:00:00'}}}
+    done_job = {'configJob': {'attributes': dict(new_job['configJob']['attributes'], operSt='success',
+                                                 fileName='new.tar.gz')}}
+    requests_mock.post(f'https://{__BASE_URL}/api/aaaLogin.json', json={'imdata': [
+        {'aaaLogin': {'attributes': {'token': 'tokenxyz'}}}
+    ]})
+    requests_mock.post(f'https://{__BASE_URL}/api/mo.json', json={"totalCount": "0", "imdata": []})
+    requests_mock.get(jobs_url, [{'json': {'imdata': [old_job]}},
+                                 {'json': {'imdata': [old_job, new_job]}},
+                                 {'json': {'imdata': [old_job, done_job]}}])
+    requests_mock.get(f'https://{__BASE_URL}/files/snapshots/new.tar.gz', content=b'x' * 3000)
+
+    aci = ACI(apicIp=__BASE_URL, apicUser='admin', apicPasword='unkown')
+    aci.login()
+    job = aci.snapshotJob(description='unit_test', download_dir=str(tmp_path))
+    assert job['operSt'] == 'success'
+    assert job['path'] == str(tmp_path / 'new.tar.gz')
+    assert (tmp_path / 'new.tar.gz').read_bytes() == b'x' * 3000
+
+
+def test_snapshot_job_timeout(requests_mock):
+    requests_mock.post(f'https://{__BASE_URL}/api/aaaLogin.json', json={'imdata': [
+        {'aaaLogin': {'attributes': {'token': 'tokenxyz'}}}
+    ]})
+    requests_mock.get(f'https://{__BASE_URL}/api/mo/uni/backupst/jobs-%5Buni/fabric/configexp-aciclient%5D.json',
+                      json={'imdata': [{'configJob': {'attributes': {'dn': 'run-new', 'operSt': 'pending'}}}]})
+
+    aci = ACI(apicIp=__BASE_URL, apicUser='admin', apicPasword='unkown')
+    aci.login()
+    assert aci.waitSnapshotJob(timeout=1, poll_min=0.1) is None
+
+
+def test_snapshot_download_404(requests_mock, tmp_path):
+    requests_mock.post(f'https://{__BASE_URL}/api/aaaLogin.json', json={'imdata': [
+        {'aaaLogin': {'attributes': {'token': 'tokenxyz'}}}
+    ]})
+    requests_mock.get(f'https://{__BASE_URL}/files/snapshots/missing.tar.gz', status_code=404)
+
+    aci = ACI(apicIp=__BASE_URL, apicUser='admin', apicPasword='unkown')
+    aci.login()
+    with pytest.raises(RequestException):
+        aci.downloadSnapshot('missing.tar.gz', str(tmp_path))
+    assert not (tmp_path / 'missing.tar.gz').exists()
+
+
+class BrokenBody(io.BytesIO):
+    def read(self, *args, **kwargs):
+        if self.tell() >= 1000:
+            raise OSError('connection reset')
+        return super().read(1000)
+
+
+def test_snapshot_download_broken(requests_mock, tmp_path):
+    requests_mock.post(f'https://{__BASE_URL}/api/aaaLogin.json', json={'imdata': [
+        {'aaaLogin': {'attributes': {'token': 'tokenxyz'}}}
+    ]})
+    requests_mock.get(f'https://{__BASE_URL}/files/snapshots/broken.tar.gz', body=BrokenBody(b'x' * 3000))
+
+    aci = ACI(apicIp=__BASE_URL, apicUser='admin', apicPasword='unkown')
+    aci.login()
+    with pytest.raises(RequestException):
+        aci.downloadSnapshot('broken.tar.gz', str(tmp_path), chunk_size=1000)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_snapshot_download_file_name(requests_mock, tmp_path):
+    requests_mock.post(f'https://{__BASE_URL}/api/aaaLogin.json', json={'imdata': [
+        {'aaaLogin': {'attributes': {'token': 'tokenxyz'}}}
+    ]})
+    requests_mock.get(f'https://{__BASE_URL}/files/snapshots/evil.tar.gz', content=b'x' * 3000)
+
+    aci = ACI(apicIp=__BASE_URL, apicUser='admin', apicPasword='unkown')
+    aci.login()
+    (tmp_path / 'backup').mkdir()
+    path = aci.downloadSnapshot('../evil.tar.gz', str(tmp_path / 'backup'))
+    assert path == str(tmp_path / 'backup' / 'evil.tar.gz')
+    assert not (tmp_path / 'evil.tar.gz').exists()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# MIT License
+# Copyright (c) 2020 Netcloud AG
+
+"""APICEmulator Testing
+
+"""
+from OpenSSL import crypto
+from requests import RequestException
+
+from aciClient.aci import ACI
+from aciClient.aciCertClient import ACICert
+from aciClient.aciEmulator import APICEmulator
+import base64
+import json
+import os
+import pytest
+import socket
+import ssl
+
+
+@pytest.fixture
+def emulator():
+    emulator = APICEmulator(max_result=10).start()
+    emulator.addMos('fvTenant', [{'dn': f'uni/tn-t{i}', 'name': f't{i}'} for i in range(25)])
+    yield emulator
+    emulator.stop()
+
+
+def _websocket(address, token):
+    # minimal websocket client, returns a function reading the next text frame
+    host, port = address.split(':')
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    sock = context.wrap_socket(socket.create_connection((host, int(port)), timeout=5))
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall((f'GET /socket{token} HTTP/1.1\r\nHost: {address}\r\nUpgrade: websocket\r\n'
+                  f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n').encode())
+    stream = sock.makefile('rb')
+    assert b'101' in stream.readline()
+    while stream.readline() not in (b'\r\n', b''):
+        pass
+
+    def receive():
+        head = stream.read(2)
+        length = head[1] & 0x7f
+        if length == 126:
+            length = int.from_bytes(stream.read(2), 'big')
+        elif length == 127:
+            length = int.from_bytes(stream.read(8), 'big')
+        return json.loads(stream.read(length))
+
+    return sock, receive
+
+
+def test_emulator_login_query_paged(emulator):
+    aci = ACI(emulator.address, 'admin', 'password')
+    assert aci.login()
+    # 25 objects are more than max_result, getJson falls back to pagination
+    assert len(aci.getJson('class/fvTenant.json')) == 25
+    assert aci.getJson('mo/uni/tn-t3.json')[0]['fvTenant']['attributes']['name'] == 't3'
+    assert aci.renewCookie()
+    aci.logout()
+
+
+def test_emulator_login_401(emulator):
+    aci = ACI(emulator.address, 'admin', 'wrong')
+    assert not aci.login()
+
+
+def test_emulator_post_delete(emulator):
+    aci = ACI(emulator.address, 'admin', 'password')
+    aci.login()
+    assert aci.postJson({'fvTenant': {'attributes': {'dn': 'uni/tn-new'},
+                                      'children': [{'fvBD': {'attributes': {'dn': 'uni/tn-new/BD-bd1'}}}]}}) == 200
+    assert emulator.count('fvBD') == 1
+    assert aci.deleteMo('uni/tn-new') == 200
+    assert emulator.getMo('uni/tn-new') is None
+    assert emulator.count('fvBD') == 0
+
+
+def test_emulator_cert_client(emulator, tmp_path):
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+    key_path = tmp_path / 'user.key'
+    key_path.write_bytes(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+    aci = ACICert(emulator.address, str(key_path), 'uni/userext/user-admin/usercert-admin')
+    assert len(aci.getJson('mo/uni/tn-t1.json')) == 1
+
+
+def test_emulator_throttling(emulator):
+    emulator.rate_limit = 2
+    emulator.retry_after = 0
+    aci = ACI(emulator.address, 'admin', 'password')
+    aci.total_retry_attempts = 0
+    aci.login()
+    with pytest.raises(RequestException):
+        for _ in range(5):
+            aci.getJson('mo/uni/tn-t1.json')
+    assert emulator.throttled > 0
+
+
+def test_emulator_subscription_push(emulator):
+    aci = ACI(emulator.address, 'admin', 'password')
+    aci.login()
+    sock, receive = _websocket(emulator.address, aci.getToken())
+    subscription = aci.subscribe('mo/uni/tn-t1.json', query_parameters=[])
+    aci.postJson({'fvTenant': {'attributes': {'dn': 'uni/tn-t1', 'descr': 'changed'}}})
+    message = receive()
+    sock.close()
+    assert message['subscriptionId'] == [subscription['subscriptionId']]
+    assert message['imdata'][0]['fvTenant']['attributes']['status'] == 'modified'
+    assert message['imdata'][0]['fvTenant']['attributes']['descr'] == 'changed'
+    assert aci.subscription_refresh(subscription['subscriptionId'])['imdata'] == []
+
+
+def test_emulator_snapshots(tmp_path):
+    with APICEmulator(snapshot_duration=0.5, snapshot_size=200000) as emulator:
+        aci = ACI(emulator.address, 'admin', 'password')
+        aci.login()
+        jobs = aci.snapshots(['uni/tn-a', 'uni/tn-b'], download_dir=str(tmp_path))
+        again = aci.snapshots(['uni/tn-a'])
+        assert aci.getJson('class/configExportP.json') == []
+    assert all(job['operSt'] == 'success' for job in jobs.values())
+    assert sorted(os.path.getsize(job['path']) for job in jobs.values()) == [200000, 200000]
+    # every target and run has its own export policy
+    assert len({job['dn'].split(']')[0] for job in [*jobs.values(), *again.values()]}) == 3
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# MIT License
+# Copyright (c) 2020 Netcloud AG
+
+"""EventPipeline Testing
+
+"""
+from aciClient.aciEventPipeline import EventPipeline, POLICY_DROP, POLICY_DROP_OLDEST
+import json
+import pytest
+import threading
+
+
+def _fault(dn, severity):
+    return {'faultInst': {'attributes': {'dn': dn, 'severity': severity}}}
+
+
+def test_pipeline_coalesce_per_dn():
+    batches = []
+    pipeline = EventPipeline(batches.append, window=0.2)
+    pipeline.start()
+    for severity in ['minor', 'major', 'critical']:
+        pipeline.submit(_fault('uni/tn-a/fault-F1', severity))
+    pipeline.submit(_fault('uni/tn-b/fault-F1', 'warning'))
+    pipeline.stop()
+    events = [event for batch in batches for event in batch]
+    assert [e['faultInst']['attributes']['severity'] for e in events] == ['critical', 'warning']
+    stats = pipeline.stats()
+    assert stats['received'] == 4
+    assert stats['coalesced'] == 2
+    assert stats['delivered'] == 2
+
+
+def _event(dn, status, **attributes):
+    return {'fvCEp': {'attributes': dict(attributes, dn=dn, status=status)}}
+
+
+def _coalesce(events):
+    batches = []
+    pipeline = EventPipeline(batches.append, window=10)
+    for event in events:
+        pipeline.submit(event)
+    pipeline.start()
+    pipeline.stop()
+    assert len(batches) == 1 and len(batches[0]) == 1
+    return batches[0][0]['fvCEp']['attributes']
+
+
+def test_pipeline_merge_created_modified():
+    attributes = _coalesce([_event('cep-1', 'created', ip='10.0.0.1', encap='vlan-10'),
+                            _event('cep-1', 'modified', ip='10.0.0.2')])
+    assert attributes == {'dn': 'cep-1', 'status': 'created', 'ip': '10.0.0.2', 'encap': 'vlan-10'}
+
+
+def test_pipeline_merge_partial_modifications():
+    attributes = _coalesce([_event('cep-1', 'modified', ip='10.0.0.2'),
+                            _event('cep-1', 'modified', encap='vlan-20')])
+    assert attributes == {'dn': 'cep-1', 'status': 'modified', 'ip': '10.0.0.2', 'encap': 'vlan-20'}
+
+
+def test_pipeline_merge_deleted():
+    attributes = _coalesce([_event('cep-1', 'created', ip='10.0.0.1'),
+                            _event('cep-1', 'modified', ip='10.0.0.2'),
+                            _event('cep-1', 'deleted')])
+    assert attributes['status'] == 'deleted'
+    attributes = _coalesce([_event('cep-1', 'deleted'), _event('cep-1', 'modified', ip='10.0.0.2')])
+    assert attributes['status'] == 'deleted'
+    attributes = _coalesce([_event('cep-1', 'deleted', ip='10.0.0.1'), _event('cep-1', 'created', mac='aa')])
+    assert attributes == {'dn': 'cep-1', 'status': 'created', 'mac': 'aa'}
+
+
+def test_pipeline_on_message_batches():
+    batches = []
+    pipeline = EventPipeline(batches.append, window=10, batch_size=3).start()
+    message = json.dumps({'subscriptionId': ['1'], 'imdata': [_fault(f'fault-{i}', 'minor') for i in range(7)]})
+    pipeline.on_message(None, message)
+    pipeline.stop()
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+
+
+def test_pipeline_drop_policy():
+    pipeline = EventPipeline(lambda batch: None, max_pending=2, policy=POLICY_DROP)
+    assert pipeline.submit(_fault('fault-1', 'minor'))
+    assert pipeline.submit(_fault('fault-2', 'minor'))
+    assert not pipeline.submit(_fault('fault-3', 'minor'))
+    # updates of a pending DN still fit
+    assert pipeline.submit(_fault('fault-1', 'major'))
+    assert pipeline.stats()['dropped'] == 1
+
+
+def test_pipeline_drop_oldest_policy():
+    batches = []
+    pipeline = EventPipeline(batches.append, max_pending=2, policy=POLICY_DROP_OLDEST, window=0)
+    for i in range(3):
+        pipeline.submit(_fault(f'fault-{i}', 'minor'))
+    pipeline.start()
+    pipeline.stop()
+    assert [e['faultInst']['attributes']['dn'] for e in batches[0]] == ['fault-1', 'fault-2']
+
+
+def test_pipeline_block_policy_slow_handler():
+    release = threading.Event()
+    delivered = []
+
+    def handler(batch):
+        release.wait()
+        delivered.extend(batch)
+
+    pipeline = EventPipeline(handler, max_pending=1, window=0, batch_size=1, block_timeout=0.2).start()
+    assert pipeline.submit(_fault('fault-1', 'minor'))
+    pipeline.submit(_fault('fault-2', 'minor'))
+    # the handler still holds fault-1 and fault-2 fills the pipeline
+    assert not pipeline.submit(_fault('fault-3', 'minor'))
+    release.set()
+    pipeline.stop()
+    assert len(delivered) == 2
+    assert pipeline.stats()['dropped'] == 1
+
+
+def test_pipeline_unknown_policy():
+    with pytest.raises(ValueError):
+        EventPipeline(print, policy='ignore')
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# MIT License
+# Copyright (c) 2020 Netcloud AG
+
+"""ACIFanout Testing
+
+"""
+from aciClient.aciFanout import ACIFanout, main
+from aciClient.aciRefreshScheduler import RefreshScheduler
+import json
+import time
+
+__FABRICS = [
+    {'name': 'fab1', 'apicIp': 'apic1.ncdev.ch', 'apicUser': 'admin', 'apicPassword': 'unkown'},
+    {'name': 'fab2', 'apicIp': 'apic2.ncdev.ch', 'apicUser': 'admin', 'apicPassword': 'unkown'},
+]
+
+
+def _mock_fabric(requests_mock, apicIp, nodes, uri='class/fabricNode.json'):
+    requests_mock.post(f'https://{apicIp}/api/aaaLogin.json', json={'imdata': [
+        {'aaaLogin': {'attributes': {'refreshTimeoutSeconds': '300', 'token': 'tokenxyz'}}}
+    ]})
+    requests_mock.post(f'https://{apicIp}/api/aaaLogout.json', json={'imdata': []})
+    requests_mock.get(f'https://{apicIp}/api/{uri}', json={'imdata': [
+        {'fabricNode': {'attributes': {'dn': f'topology/pod-1/node-{node}'}}} for node in nodes
+    ]})
+
+
+def test_fanout_query_ok(requests_mock):
+    _mock_fabric(requests_mock, 'apic1.ncdev.ch', [101, 102])
+    _mock_fabric(requests_mock, 'apic2.ncdev.ch', [201])
+    fanout = ACIFanout(__FABRICS)
+    assert fanout.login() == {'fab1': None, 'fab2': None}
+    records = list(fanout.query('class/fabricNode.json'))
+    fanout.logout()
+    assert len(records) == 3
+    assert sorted(r['fabric'] for r in records) == ['fab1', 'fab1', 'fab2']
+    assert all('fabricNode' in r for r in records)
+
+
+def test_fanout_login_401(requests_mock):
+    _mock_fabric(requests_mock, 'apic1.ncdev.ch', [101])
+    requests_mock.post('https://apic2.ncdev.ch/api/aaaLogin.json', json={'imdata': []}, status_code=401)
+    fanout = ACIFanout(__FABRICS)
+    errors = fanout.login()
+    records = list(fanout.query('class/fabricNode.json'))
+    assert errors == {'fab1': None, 'fab2': 'login failed'}
+    assert [r['fabric'] for r in records] == ['fab1']
+
+
+def test_fanout_slow_fabric_timeout(requests_mock):
+    _mock_fabric(requests_mock, 'apic1.ncdev.ch', [101])
+    _mock_fabric(requests_mock, 'apic2.ncdev.ch', [201])
+    fabrics = [dict(__FABRICS[0]), dict(__FABRICS[1], timeout=0.5)]
+    fanout = ACIFanout(fabrics)
+    fanout.login()
+
+    # requests_mock serializes all requests, so the slow fabric is slowed down above the transport
+    def slow(uri):
+        time.sleep(2)
+        return []
+
+    fanout.clients['fab2'].getJson = slow
+    start = time.monotonic()
+    records = list(fanout.query('class/fabricNode.json'))
+    assert time.monotonic() - start < 1.5
+    assert records[0]['fabric'] == 'fab1'
+    assert records[1] == {'fabric': 'fab2', 'error': 'timeout after 0.5s'}
+
+
+def test_fanout_slow_fabrics_exceed_workers(requests_mock):
+    fabrics = [dict(name=f'fab{i}', apicIp=f'apic{i}.ncdev.ch', apicUser='admin', apicPassword='unkown',
+                    timeout=0.5) for i in range(1, 4)]
+    for i in range(1, 4):
+        _mock_fabric(requests_mock, f'apic{i}.ncdev.ch', [i])
+    fanout = ACIFanout(fabrics, max_workers=2)
+    fanout.login()
+
+    def slow(uri):
+        time.sleep(3)
+        return []
+
+    fanout.clients['fab1'].getJson = slow
+    fanout.clients['fab2'].getJson = slow
+    start = time.monotonic()
+    records = {}
+    for record in fanout.query('class/fabricNode.json'):
+        records[record['fabric']] = (record, time.monotonic() - start)
+    assert records['fab3'][1] < 1.5
+    assert 'fabricNode' in records['fab3'][0]
+    assert records['fab1'][0]['error'] == 'timeout after 0.5s'
+    assert records['fab2'][0]['error'] == 'timeout after 0.5s'
+
+    # the abandoned calls don't hold the workers of the next query
+    start = time.monotonic()
+    fanout.clients['fab1'].getJson = fanout.clients['fab2'].getJson = lambda uri: []
+    assert len(list(fanout.query('class/fabricNode.json'))) == 1
+    assert time.monotonic() - start < 0.5
+
+
+def test_fanout_late_login_logged_out(requests_mock):
+    _mock_fabric(requests_mock, 'apic1.ncdev.ch', [101])
+    _mock_fabric(requests_mock, 'apic2.ncdev.ch', [201])
+    scheduler = RefreshScheduler()
+    fanout = ACIFanout([dict(__FABRICS[0]), dict(__FABRICS[1], timeout=0.5)], scheduler=scheduler)
+    aci = fanout.fabrics['fab2']
+    login = aci.login
+
+    def slow_login():
+        time.sleep(1)
+        return login()
+
+    aci.login = slow_login
+    assert fanout.login() == {'fab1': None, 'fab2': 'timeout after 0.5s'}
+    assert list(fanout.clients) == ['fab1']
+
+    # the session opened after the timeout is logged out again and no longer refreshed
+    def logged_out():
+        return any(r.url == 'https://apic2.ncdev.ch/api/aaaLogout.json' for r in requests_mock.request_history)
+
+    deadline = time.monotonic() + 3
+    while not logged_out() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert logged_out()
+    assert not aci.refresh_auto
+    assert scheduler.sessions() == 1
+    fanout.logout()
+    assert scheduler.sessions() == 0
+    scheduler.close()
+
+
+def test_fanout_bounded_retries():
+    fanout = ACIFanout([dict(__FABRICS[0], timeout=30)], retries=2)
+    aci = fanout.fabrics['fab1']
+    assert aci.total_retry_attempts == 2
+    assert aci.request_timeout == 10
+    assert aci.retry_backoff_factor == 1.5
+
+
+def test_fanout_main_ndjson(requests_mock, tmp_path, capsys):
+    _mock_fabric(requests_mock, 'apic1.ncdev.ch', [101, 102])
+    _mock_fabric(requests_mock, 'apic2.ncdev.ch', [201])
+    inventory = tmp_path / 'inventory.json'
+    inventory.write_text(json.dumps({'fabrics': __FABRICS}))
+    assert main([str(inventory), 'class/fabricNode.json']) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 3
+    assert {json.loads(line)['fabric'] for line in lines} == {'fab1', 'fab2'}
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# MIT License
+# Copyright (c) 2020 Netcloud AG
+
+"""RefreshScheduler Testing
+
+"""
+from aciClient.aci import ACI
+from aciClient.aciRefreshScheduler import RefreshScheduler
+import threading
+import time
+
+__BASE_URL = 'testing-apic.ncdev.ch'
+
+
+def _mock_login(requests_mock, refresh_timeout='31', token='tokenxyz'):
+    requests_mock.post(f'https://{__BASE_URL}/api/aaaLogin.json', json={'imdata': [
+        {'aaaLogin': {'attributes': {'refreshTimeoutSeconds': refresh_timeout, 'token': token}}}
+    ]})
+    requests_mock.post(f'https://{__BASE_URL}/api/aaaLogout.json', json={'imdata': []}, status_code=200)
+
+
+def test_scheduler_refresh_ok(requests_mock):
+    _mock_login(requests_mock)
+    requests_mock.post(f'https://{__BASE_URL}/api/aaaRefresh.json', json={'imdata': [
+        {'aaaLogin': {'attributes': {'refreshTimeoutSeconds': '300', 'token': 'tokenabc'}}}
+    ]})
+    scheduler = RefreshScheduler(jitter=0)
+    aci = ACI(apicIp=__BASE_URL, apicUser='admin', apicPasword='unkown', refresh=True, scheduler=scheduler)
+    aci.login()
+    time.sleep(2)
+    assert aci.getToken() == 'tokenabc'
+    assert aci.refresh_thread is None
+    assert scheduler.sessions() == 1
+    aci.logout()
+    assert scheduler.sessions() == 0
+    scheduler.close()
+
+
+def test_scheduler_refresh_nok_relogin(requests_mock):
+    _mock_login(requests_mock, token='tokenrelogin')
+    requests_mock.post(f'https://{__BASE_URL}/api/aaaRefresh.json', json={'imdata': []}, status_code=403)
+    scheduler = RefreshScheduler(jitter=0)
+    aci = ACI(apicIp=__BASE_URL, apicUser='admin', apicPasword='unkown', refresh=True, scheduler=scheduler)
+    aci.login()
+    time.sleep(2)
+    assert aci.getToken() == 'tokenrelogin'
+    assert aci.refresh_auto
+    assert requests_mock.call_count >= 3
+    scheduler.close()
+
+
+def test_scheduler_many_sessions(requests_mock):
+    _mock_login(requests_mock, refresh_timeout='300')
+    scheduler = RefreshScheduler(max_workers=2)
+    sessions = [ACI(apicIp=__BASE_URL, apicUser='admin', apicPasword='unkown', refresh=True, scheduler=scheduler)
+                for _ in range(50)]
+    for aci in sessions:
+        aci.login()
+    assert scheduler.sessions() == 50
+    for aci in sessions:
+        aci.logout()
+    assert scheduler.sessions() == 0
+    scheduler.close()
+
+
+def test_scheduler_logout_during_relogin(requests_mock):
+    logins = []
+
+    def login(request, context):
+        logins.append(request)
+        if len(logins) == 2:
+            # the user logs out while the scheduler falls back to a new login
+            aci.logout()
+        return {'imdata': [{'aaaLogin': {'attributes': {'refreshTimeoutSeconds': '31', 'token': 'tokenxyz'}}}]}
+
+    requests_mock.post(f'https://{__BASE_URL}/api/aaaLogin.json', json=login)
+    requests_mock.post(f'https://{__BASE_URL}/api/aaaLogout.json', json={'imdata': []}, status_code=200)
+    requests_mock.post(f'https://{__BASE_URL}/api/aaaRefresh.json', json={'imdata': []}, status_code=403)
+    scheduler = RefreshScheduler(jitter=0)
+    aci = ACI(apicIp=__BASE_URL, apicUser='admin', apicPasword='unkown', refresh=True, scheduler=scheduler)
+    aci.login()
+    time.sleep(3)
+    assert len(logins) == 2
+    assert not aci.refresh_auto
+    assert scheduler.sessions() == 0
+    scheduler.close()
+
+
+class SlowSession:
+    apicIp = 'slow-apic'
+    refresh_auto = True
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.renewing = threading.Event()
+
+    def renewCookie(self, timeout=None):
+        self.renewing.set()
+        time.sleep(0.5)
+        self.scheduler.register(self, 30)
+        return True
+
+
+def test_scheduler_close_during_refresh():
+    scheduler = RefreshScheduler(jitter=0)
+    aci = SlowSession(scheduler)
+    scheduler.register(aci, 0)
+    assert aci.renewing.wait(5)
+    scheduler.close()
+    assert scheduler.sessions() == 0
+    assert not [thread for thread in threading.enumerate() if thread.name == 'aciClient-refresh']
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# MIT License
+# Copyright (c) 2020 Netcloud AG
+
+"""StatsCollector Testing
+
+"""
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from aciClient import aciStatsCollector  # noqa: E402
+from aciClient.aciStatsCollector import StatsCollector  # noqa: E402
+
+
+class FakeACI:
+    # returns the queued imdata of a class on every getJson
+
+    def __init__(self):
+        self.responses = []
+
+    def getJson(self, uri):
+        return self.responses.pop(0)
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def time(self):
+        return self.now
+
+
+def _ingr(dn, unicast):
+    return {'eqptIngrBytes5min': {'attributes': {'dn': dn, 'unicastCum': str(unicast)}}}
+
+
+def _collector(monkeypatch, samples, counter_bits=64, capacity=10):
+    aci = FakeACI()
+    clock = FakeClock()
+    monkeypatch.setattr(aciStatsCollector, 'time', clock)
+    collector = StatsCollector(aci, counters={'eqptIngrBytes5min': ['unicastCum']}, capacity=capacity,
+                               counter_bits=counter_bits)
+    for timestamp, imdata in samples:
+        clock.now = timestamp
+        aci.responses.append(imdata)
+        collector.poll()
+    return collector
+
+
+def test_stats_rates_ok(monkeypatch):
+    collector = _collector(monkeypatch, [
+        (0, [_ingr('eth1/1', 1000), _ingr('eth1/2', 0)]),
+        (10, [_ingr('eth1/1', 2000), _ingr('eth1/2', 500)]),
+        (20, [_ingr('eth1/1', 4000), _ingr('eth1/2', 1000)]),
+    ])
+    dns, times, rates = collector.rates('eqptIngrBytes5min', 'unicastCum')
+    assert dns == ['eth1/1', 'eth1/2']
+    assert list(times) == [10, 20]
+    assert rates.tolist() == [[100.0, 200.0], [50.0, 50.0]]
+
+
+def test_stats_counter_wrap(monkeypatch):
+    collector = _collector(monkeypatch, [
+        (0, [_ingr('eth1/1', 2 ** 32 - 100)]),
+        (10, [_ingr('eth1/1', 900)]),
+    ], counter_bits=32)
+    _, _, rates = collector.rates('eqptIngrBytes5min', 'unicastCum')
+    assert rates.tolist() == [[100.0]]
+
+
+def test_stats_counter_reset(monkeypatch):
+    samples = [
+        (0, [_ingr('eth1/1', 5000)]),
+        (10, [_ingr('eth1/1', 6000)]),
+        (20, [_ingr('eth1/1', 100)]),
+        (30, [_ingr('eth1/1', 600)]),
+    ]
+    for counter_bits in (64, 32):
+        _, _, rates = _collector(monkeypatch, samples, counter_bits=counter_bits).rates('eqptIngrBytes5min',
+                                                                                        'unicastCum')
+        assert np.isnan(rates[0, 1])
+        assert rates[0, [0, 2]].tolist() == [100.0, 50.0]
+
+
+def test_stats_missing_dn_and_latest(monkeypatch):
+    collector = _collector(monkeypatch, [
+        (0, [_ingr('eth1/1', 0)]),
+        (10, [_ingr('eth1/1', 100), _ingr('eth1/2', 7)]),
+    ])
+    dns, values = collector.latest('eqptIngrBytes5min', 'unicastCum')
+    assert dns == ['eth1/1', 'eth1/2']
+    assert values.tolist() == [100.0, 7.0]
+    _, _, rates = collector.rates('eqptIngrBytes5min', 'unicastCum')
+    assert rates[0, 0] == 10.0
+    assert np.isnan(rates[1, 0])
+
+
+def test_stats_ring_buffer_and_percentiles(monkeypatch):
+    collector = _collector(monkeypatch, [(t * 10, [_ingr('eth1/1', t * t * 10)]) for t in range(8)], capacity=4)
+    dns, times, values = collector.series('eqptIngrBytes5min', 'unicastCum')
+    assert list(times) == [40, 50, 60, 70]
+    assert values.tolist() == [[160.0, 250.0, 360.0, 490.0]]
+    _, percentiles = collector.percentiles('eqptIngrBytes5min', 'unicastCum', q=(0, 100))
+    assert percentiles.tolist() == [[9.0, 13.0]]
+
+
+def test_stats_poll_error():
+    aci = FakeACI()
+    aci.responses.append({'error': 'Not found'})
+    collector = StatsCollector(aci, counters={'eqptIngrBytes5min': ['unicastCum']})
+    assert not collector.poll()
+    dns, values = collector.latest('eqptIngrBytes5min', 'unicastCum')
+    assert dns == []